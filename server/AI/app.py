@@ -1,19 +1,59 @@
-from flask import Flask, request, send_file, jsonify, Response
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
 import numpy as np
 import cv2
 from io import BytesIO
 import os
 from PIL import Image
-from controllers.brainMRIController import predict_mri
-from controllers.gradcam_controller import predict_and_gradcam
 import base64
 import json
-from controllers.Lungs import predict_lungs, generate_gradcam_images
+import math
+import hmac
+from controllers import placement
+from controllers.overlays import render_gradcam_images, combine_images
+from controllers.analysis_archive import archive, archive_lungs, archive_brain, u8_to_cam, jpeg_to_image
+from controllers.raw_input import is_raw_request, read_raw_image
+import time
 
 app = Flask(__name__)
 
+# ---------- Models ----------
+# Each model group runs in-process, or in pinned worker processes when
+# placement.json / MODEL_PLACEMENT assigns it CPUs (see controllers/placement.py).
+BRAIN = "controllers.brainMRIController"
+GRADCAM = "controllers.gradcam_controller"
+LUNGS = "controllers.Lungs"
+placement.start()
+
+def predict_mri(img):
+    return placement.run(BRAIN, "predict_mri", img)
+
+def predict_and_gradcam(img, tol=None):
+    return placement.run(GRADCAM, "predict_and_gradcam", img, tol=tol)
+
+def predict_and_gradcam_stream(img, tol=None):
+    return placement.stream(GRADCAM, "predict_and_gradcam_stream", img, tol=tol)
+
+def analyze_lungs(img, threshold):
+    return placement.run(LUNGS, "analyze_lungs", img, threshold=threshold)
+
+def predict_lungs_cascade(images, threshold, band):
+    return placement.run(LUNGS, "predict_lungs_cascade", images, threshold=threshold, band=band)
+
+# ---------- Raw uint8 input (application/x-npy or application/octet-stream + X-Image-Shape) ----------
+def get_raw_image():
+    try:
+        return read_raw_image(request), None
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
 @app.route("/predict", methods=["POST"])
 def predict_route():
+    if is_raw_request(request):
+        img, error = get_raw_image()
+        if error:
+            return error
+        return jsonify(predict_mri(img))
+
     if "file" not in request.files:
         return jsonify({"error": "No image file provided"}), 400
 
@@ -22,23 +62,37 @@ def predict_route():
     if file.filename == "":
         return jsonify({"error": "File name is empty"}), 400
 
-    result = predict_mri(file)
+    result = predict_mri(file.read())
     return jsonify(result)
 
 @app.route("/gradcam", methods=["POST"])
 def predict():
-    if "image" not in request.files:
+    tol, error = get_tta_tol()
+    if error:
+        return error
+
+    if is_raw_request(request):
+        img, error = get_raw_image()
+        if error:
+            return error
+    elif "image" not in request.files:
         return {"error": "No image uploaded"}, 400
+    else:
+        img = request.files["image"].read()
+
+    if wants_stream():
+        return gradcam_stream_response(img, tol)
 
-    file = request.files["image"]
-    result = predict_and_gradcam(file.read())
+    result = predict_and_gradcam(img, tol=tol)
 
     combined_pil = Image.fromarray(cv2.cvtColor(result["combined_image"], cv2.COLOR_BGR2RGB))
     buf = BytesIO()
     combined_pil.save(buf, format="PNG")
     buf.seek(0)
 
-    return send_file(buf, mimetype="image/png")
+    response = send_file(buf, mimetype="image/png")
+    response.headers["X-Model-Version"] = str(result["model_version"]["version"])
+    return response
 
 
 import base64
@@ -51,25 +105,82 @@ def array_to_base64(img_array):
     buf.seek(0)
     return base64.b64encode(buf.getvalue()).decode("utf-8")
 
+# ---------- Progressive Grad-CAM streaming (Server-Sent Events) ----------
+def wants_stream():
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+def get_tta_tol():
+    """Parse ?tol= before any model work; returns (tol, error_response)."""
+    raw = request.args.get("tol")
+    if not raw:
+        return None, None
+    try:
+        tol = float(raw)
+    except ValueError:
+        tol = None
+    if tol is None or not math.isfinite(tol) or tol < 0:
+        return None, (jsonify({"error": "tol must be a finite number >= 0"}), 400)
+    return tol, None
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def gradcam_stream_response(img_bytes, tol, report=None):
+    """Send a coarse heatmap after the first TTA view and a refined one after each later view."""
+    def generate():
+        if report is not None:
+            yield sse_event("report", {"report": report})
+        for step in predict_and_gradcam_stream(img_bytes, tol=tol):
+            payload = {
+                "views_done": step["views_done"],
+                "total_views": step["total_views"],
+                "delta": step["delta"],
+                "done": step["done"],
+                "gradcam_model_version": step["model_version"],
+                "gradcam_image": array_to_base64(step["combined_image"])
+            }
+            if step["done"] and report is not None:
+                payload["analysis_id"] = archive_brain(report, report["probabilities"], step["heatmap"], step["orig_bgr"])
+            yield sse_event("gradcam", payload)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/predict_full", methods=["POST"])
 def predict_full():
-    if "image" not in request.files:
-        return jsonify({"error": "No image uploaded"}), 400
-
-    file = request.files["image"]
-
-    if file.filename == "":
-        return jsonify({"error": "File name is empty"}), 400
-    report = predict_mri(file)
-
-    file.seek(0)
-
-    gradcam_result = predict_and_gradcam(file.read())
+    tol, error = get_tta_tol()
+    if error:
+        return error
+
+    if is_raw_request(request):
+        img, error = get_raw_image()
+        if error:
+            return error
+        report = predict_mri(img)
+    else:
+        if "image" not in request.files:
+            return jsonify({"error": "No image uploaded"}), 400
+
+        file = request.files["image"]
+
+        if file.filename == "":
+            return jsonify({"error": "File name is empty"}), 400
+        img = file.read()
+        report = predict_mri(img)
+
+    if wants_stream():
+        return gradcam_stream_response(img, tol, report=report)
+
+    gradcam_result = predict_and_gradcam(img, tol=tol)
     gradcam_base64 = array_to_base64(gradcam_result["combined_image"])
+    analysis_id = archive_brain(report, report["probabilities"], gradcam_result["heatmap"], gradcam_result["orig_bgr"])
 
     return jsonify({
+        "analysis_id": analysis_id,
         "report": report,               
-        "gradcam_image": gradcam_base64  
+        "gradcam_image": gradcam_base64,
+        # report["model_version"] is the report model; a reload between the two calls shows up here
+        "gradcam_model_version": gradcam_result["model_version"]
     })
 # @app.route("/predict_full", methods=["POST"])
 # def predict_full():
@@ -104,25 +215,221 @@ def predict_full():
 
 @app.route("/predict-lungs", methods=["POST"])
 def predict_lungs_route():
-    if "image" not in request.files:
+    if is_raw_request(request):
+        img, error = get_raw_image()
+        if error:
+            return error
+    elif "image" not in request.files:
         return jsonify({"error": "Image file missing"}), 400
+    else:
+        img = request.files["image"].read()
 
-    img_bytes = request.files["image"].read()
+    threshold = 0.001
+    # One call: labels and Grad-CAMs come from the same model version
+    result = analyze_lungs(img, threshold=threshold)
+    cams = result["cams"]
+    gradcams = render_gradcam_images(result["raw_img"], cams) if cams else {}
+    analysis_id = archive_lungs(result["preds"], result["labels"], result["report"], result["raw_img"], cams, threshold)
 
-    preds, labels, raw_img, report = predict_lungs(img_bytes, threshold=0.001)
-
-    gradcams = {}
-    if labels:
-        gradcams = generate_gradcam_images(img_bytes, labels)
+    return jsonify({
+        "analysis_id": analysis_id,
+        "labels": result["labels"],
+        "report": result["report"],
+        "gradcam_images": gradcams,
+        "model_version": result["model_version"]
+    })
 
+# ---------- Cascade: low-res screen first, full model only when uncertain ----------
+def get_cascade_band():
+    """Parse ?band_lo= / ?band_hi= before any model work; returns (band, error_response).
+
+    Missing edges stay None and fall back to CASCADE_BAND in controllers/Lungs.py.
+    """
+    band = []
+    for key in ("band_lo", "band_hi"):
+        raw = request.args.get(key)
+        if not raw:
+            band.append(None)
+            continue
+        try:
+            value = float(raw)
+        except ValueError:
+            value = None
+        if value is None or not math.isfinite(value) or not 0 <= value <= 1:
+            return None, (jsonify({"error": f"{key} must be a number between 0 and 1"}), 400)
+        band.append(value)
+    if None not in band and band[0] > band[1]:
+        return None, (jsonify({"error": "band_lo must not be above band_hi"}), 400)
+    return tuple(band), None
+
+@app.route("/predict-lungs-cascade", methods=["POST"])
+def predict_lungs_cascade_route():
+    if is_raw_request(request):
+        img, error = get_raw_image()
+        if error:
+            return error
+        images = [img]
+    else:
+        images = [f.read() for f in request.files.getlist("image")]
+        if not images:
+            return jsonify({"error": "Image file missing"}), 400
+
+    band, error = get_cascade_band()
+    if error:
+        return error
+
+    threshold = 0.001
+    try:
+        results, stats = predict_lungs_cascade(images, threshold=threshold, band=band)
+    except ValueError as e:
+        # One edge given and the other, from CASCADE_BAND, ends up on the wrong side of it
+        return jsonify({"error": str(e)}), 400
+
+    out = []
+    for r in results:
+        analysis_id = archive_lungs(r["preds"], r["labels"], r["report"], r["raw_img"], r["cams"], threshold)
+        out.append({
+            "analysis_id": analysis_id,
+            "stage": r["stage"],
+            "labels": r["labels"],
+            "report": r["report"],
+            "gradcam_images": render_gradcam_images(r["raw_img"], r["cams"]) if r["cams"] else {},
+            "model_version": r["model_version"]
+        })
+
+    return jsonify({"results": out, "stats": stats})
+
+# ---------- Stored analyses (no model work) ----------
+@app.route("/archive/<analysis_id>", methods=["GET"])
+def archived_analysis(analysis_id):
+    start = time.perf_counter()
+    record = archive.get(analysis_id)
+    if record is None:
+        return jsonify({"error": "Analysis not found"}), 404
+    read_ms = (time.perf_counter() - start) * 1000
+
+    arrays = record["arrays"]
+    meta = record["meta"]
+    render = request.args.get("overlay", "1").lower() not in ("0", "false", "no")
+    base_img = jpeg_to_image(arrays["image"]) if render else None
+
+    if record["kind"] == "lungs":
+        cam_labels = meta["cam_labels"]
+        gradcams = {}
+        if render and cam_labels:
+            cams = {lab: u8_to_cam(arrays["cams"][i]) for i, lab in enumerate(cam_labels)}
+            gradcams = render_gradcam_images(base_img, cams)
+        result = {
+            "analysis_id": record["id"],
+            "labels": meta["labels"],
+            "probabilities": arrays["probs"].astype(float).tolist(),
+            "report": meta["report"],
+            "gradcam_images": gradcams
+        }
+    else:
+        result = {
+            "analysis_id": record["id"],
+            "probabilities": arrays["probs"].astype(float).tolist(),
+            "report": meta["report"],
+            "gradcam_image": array_to_base64(combine_images(base_img, u8_to_cam(arrays["cam"]))) if render else None
+        }
+
+    response = jsonify(result)
+    response.headers["X-Archive-Read-Ms"] = f"{read_ms:.3f}"
+    response.headers["X-Archive-Total-Ms"] = f"{(time.perf_counter() - start) * 1000:.3f}"
+    return response
+
+@app.route("/archive/stats", methods=["GET"])
+def archive_stats():
+    return jsonify(archive.stats())
+
+# ---------- Admin: model hot-reload ----------
+# "brain" covers both copies of the brain model (report + Grad-CAM)
+MODEL_GROUPS = {"brain": ["brain", "brain_gradcam"], "lungs": ["lungs", "lungs_screen"]}
+SLOT_GROUP = {slot: group for group, slots in MODEL_GROUPS.items() for slot in slots}
+# A group reload with an explicit path loads it into these slots only; the rest
+# reload their current file (lungs_screen keeps a distilled screen unless named directly)
+PATH_SLOTS = {"brain": ["brain", "brain_gradcam"], "lungs": ["lungs"]}
+
+def slot_statuses(names):
+    """{slot name: [status in each process that holds it]}"""
+    status = {n: [] for n in names}
+    for group in sorted({SLOT_GROUP[n] for n in names}):
+        for process_status in placement.broadcast_to_group(group, "controllers.model_slot", "models_status"):
+            for n in names:
+                if SLOT_GROUP[n] == group and n in process_status:
+                    status[n].append(process_status[n])
+    return status
+
+# Reloads may only point at files in here (model loading can fall back to safe_mode=False)
+MODELS_DIR = os.path.realpath("models")
+
+def admin_error():
+    """None if the request carries the admin token, else the error response.
+
+    Admin routes stay closed until ADMIN_TOKEN is set.
+    """
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        return jsonify({"error": "Admin routes are disabled; set ADMIN_TOKEN to enable them"}), 403
+    given = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+def model_file_error(path):
+    """None if path is an existing file under models/, else the error response."""
+    real = os.path.realpath(path)
+    if os.path.commonpath([real, MODELS_DIR]) != MODELS_DIR:
+        return jsonify({"error": f"Model path must be inside models/: {path}"}), 400
+    if not os.path.isfile(real):
+        return jsonify({"error": f"Model file not found: {path}"}), 400
+    return None
+
+@app.route("/admin/models", methods=["GET"])
+def admin_models():
+    error = admin_error()
+    if error:
+        return error
     return jsonify({
-        "labels": labels,
-        "report": report,
-        "gradcam_images": gradcams
+        "placement": placement.placement_status(),
+        "models": slot_statuses(list(SLOT_GROUP))
     })
 
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    error = admin_error()
+    if error:
+        return error
+
+    body = request.get_json(silent=True) or {}
+    name = body.get("model") or request.args.get("model")
+    path = body.get("path") or request.args.get("path")
+    names = MODEL_GROUPS.get(name, [name] if name in SLOT_GROUP else None)
+    if not names:
+        return jsonify({"error": f"Unknown model: {name}", "models": sorted(MODEL_GROUPS)}), 400
+    if path:
+        error = model_file_error(path)
+        if error:
+            return error
+
+    targets = PATH_SLOTS.get(name, names)
+    paths = {n: path for n in targets} if path else {}
+
+    started = {n: [] for n in names}
+    for group in sorted({SLOT_GROUP[n] for n in names}):
+        group_names = [n for n in names if SLOT_GROUP[n] == group]
+        for process_started in placement.broadcast_to_group(group, "controllers.model_slot", "reload_slots", group_names, paths):
+            for n, ok in process_started.items():
+                started[n].append(ok)
+    return jsonify({
+        "started": started,
+        "models": slot_statuses(names)
+    }), 202
+
 
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # The debug reloader would start a second set of pinned workers
+    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=not placement.WORKERS)
@@ -0,0 +1,68 @@
+# placement_scaling.py
+# Throughput of one model group against the number of cores it is pinned to.
+# Each step starts a fresh pinned worker (controllers/placement.py) on the first
+# N CPUs of the chosen set and pushes synthetic uint8 images through it.
+# Run from server/AI:
+#   python benchmarks/placement_scaling.py --group lungs --cores 1,2,4,8,16 --node 0
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.placement import ModelWorker, numa_node_cpus, parse_cpu_list
+
+CALLS = {
+    # group: (module, function, input shape, kwargs)
+    "lungs": ("controllers.Lungs", "predict_lungs", (224, 224, 3), {"threshold": 0.001}),
+    "brain": ("controllers.brainMRIController", "predict_mri", (260, 260, 3), {}),
+    "gradcam": ("controllers.gradcam_controller", "predict_and_gradcam", (260, 260, 3), {}),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--group", choices=sorted(CALLS), default="lungs")
+    parser.add_argument("--cores", default="1,2,4,8,16")
+    parser.add_argument("--node", type=int, default=None, help="take cores from this NUMA node")
+    parser.add_argument("--cpus", default=None, help="take cores from this cpulist instead, e.g. 0-31")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes sharing the cores")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.cpus:
+        pool = parse_cpu_list(args.cpus)
+    elif args.node is not None:
+        pool = numa_node_cpus(args.node)
+    else:
+        pool = sorted(os.sched_getaffinity(0))
+
+    module, func, shape, kwargs = CALLS[args.group]
+    group = "lungs" if args.group == "lungs" else "brain"
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, size=shape, dtype=np.uint8) for _ in range(8)]
+
+    print(f"{'cores':>6}{'processes':>11}{'req/s':>9}{'ms/req':>9}{'req/s/core':>12}")
+    for n in [int(c) for c in args.cores.split(",")]:
+        if n > len(pool) or n < args.processes:
+            continue
+        worker = ModelWorker(group, {"cpus": pool[:n], "processes": args.processes})
+        try:
+            worker.call(module, func, images[0], **kwargs)  # warm-up
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as ex:
+                list(ex.map(lambda i: worker.call(module, func, images[i % len(images)], **kwargs),
+                            range(args.requests)))
+            seconds = time.perf_counter() - start
+        finally:
+            worker.shutdown()
+        rps = args.requests / seconds
+        print(f"{n:>6}{args.processes:>11}{rps:>9.2f}{seconds / args.requests * 1000:>9.1f}{rps / n:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# raw_input_bench.py
+# Per-request CPU time of the PNG upload path vs the raw uint8 path.
+# Run from server/AI (model paths are relative):  python benchmarks/raw_input_bench.py
+import argparse
+import io
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep benchmark requests out of the real analysis archive
+os.environ["ANALYSIS_ARCHIVE_DIR"] = tempfile.mkdtemp(prefix="raw_input_bench_archive_")
+
+from app import app
+from controllers import Lungs
+
+
+def make_inputs(size):
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 256, size=(size[0], size[1], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format="PNG")
+    npy = io.BytesIO()
+    np.save(npy, arr)
+    return buf.getvalue(), npy.getvalue(), arr.tobytes()
+
+
+def cpu_per_call(fn, n):
+    fn()  # warm-up
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - start_cpu) / n * 1000, (time.perf_counter() - start_wall) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=50)
+    parser.add_argument("--route", default="/predict-lungs")
+    args = parser.parse_args()
+
+    size = (Lungs.IMG_H, Lungs.IMG_W)
+    png, npy, raw = make_inputs(size)
+    shape = f"{size[0]},{size[1]},3"
+    client = app.test_client()
+
+    cases = {
+        "png  decode only": lambda: Lungs.load_image(png),
+        "raw  decode only": lambda: Lungs.load_image(np.frombuffer(raw, dtype=np.uint8).reshape(size + (3,))),
+        "png  full request": lambda: client.post(args.route, data={"image": (io.BytesIO(png), "x.png")}),
+        "npy  full request": lambda: client.post(args.route, data=npy, content_type="application/x-npy"),
+        "raw  full request": lambda: client.post(args.route, data=raw, content_type="application/octet-stream",
+                                                headers={"X-Image-Shape": shape}),
+    }
+
+    print(f"{'case':<20}{'cpu ms/req':>12}{'wall ms/req':>13}")
+    for name, fn in cases.items():
+        cpu_ms, wall_ms = cpu_per_call(fn, args.n)
+        print(f"{name:<20}{cpu_ms:>12.2f}{wall_ms:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,32 @@
 import os
 import numpy as np
 import tensorflow as tf
-from tensorflow.keras.preprocessing import image as keras_image
 import matplotlib.pyplot as plt
 import cv2
 import io
-import base64
+import time
 from PIL import Image
+from controllers.raw_input import fit_image_array
+from controllers.model_slot import ModelSlot
+from controllers.overlays import render_gradcam_images
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 MODEL_PATH = "models/best_model.keras"
 IMG_H, IMG_W = 224, 224
+
+# Cascade: a cheap screen runs first on the max label probability.
+#   below band_lo          -> reported NORMAL, no labels
+#   band_lo .. band_hi     -> full model and Grad-CAM
+#   above band_hi          -> screen labels, no full model
+# Without a distilled screen model, the full network is rebuilt at SCREEN_H x SCREEN_W.
+# The default band is uncalibrated and therefore clears nothing: every image goes to
+# the full model, so the cascade agrees with /predict-lungs. Pick both edges for
+# the screen in use with tools/pick_cascade_band.py (or pass ?band_lo=&band_hi=).
+SCREEN_MODEL_PATH = "models/lungs_screen.keras"
+SCREEN_H, SCREEN_W = 112, 112
+CASCADE_BAND = (0.0, 1.0)
 LABELS = ['Cardiomegaly','Emphysema','Effusion','Hernia','Infiltration',
           'Mass','Nodule','Atelectasis','Pneumothorax','Pleural_Thickening',
           'Pneumonia','Fibrosis','Edema','Consolidation']
@@ -226,33 +240,124 @@ neg_weights = np.ones(len(LABELS))
 custom_objects = {"weighted_loss": get_weighted_loss(pos_weights, neg_weights)}
 
 # -----------------------------
-# LOAD MODEL (only once)
+# LOAD MODEL (hot-reloadable slot)
 # -----------------------------
-print("Loading lungs model...")
-model = tf.keras.models.load_model(MODEL_PATH, custom_objects=custom_objects)
-print("Model loaded successfully!")
+def load_lungs_model(path):
+    print("Loading lungs model...")
+    model = tf.keras.models.load_model(path, custom_objects=custom_objects)
+    print("Model loaded successfully!")
+    return model
+
+def warm_lungs_model(model):
+    model.predict(np.zeros((1, IMG_H, IMG_W, 3), dtype=np.float32), verbose=0)
+
+lungs_slot = ModelSlot("lungs", MODEL_PATH, load_lungs_model, warm_lungs_model)
+
+# -----------------------------
+# SCREEN MODEL (first cascade stage)
+# -----------------------------
+def _resize_input_shapes(config, h, w):
+    if isinstance(config, dict):
+        for key in ("batch_shape", "batch_input_shape", "build_input_shape"):
+            shape = config.get(key)
+            if isinstance(shape, (list, tuple)) and len(shape) == 4:
+                config[key] = [shape[0], h, w, shape[3]]
+        for value in config.values():
+            _resize_input_shapes(value, h, w)
+    elif isinstance(config, list):
+        for value in config:
+            _resize_input_shapes(value, h, w)
+
+def build_screen_model(model, h=SCREEN_H, w=SCREEN_W):
+    """Same architecture and weights at a lower input resolution.
+
+    DenseNet ends in global pooling, so the weights do not depend on the input size.
+    """
+    config = model.get_config()
+    _resize_input_shapes(config, h, w)
+    screen = model.__class__.from_config(config, custom_objects=custom_objects)
+    screen.set_weights(model.get_weights())
+    return screen
+
+def load_screen_model(path):
+    # Raises on failure, so a bad reload keeps the active screen and records the error
+    model = load_lungs_model(path)
+    if tuple(model.input_shape[1:3]) != (SCREEN_H, SCREEN_W):
+        model = build_screen_model(model)
+    print(f"Screen model ready ({SCREEN_H}x{SCREEN_W})")
+    return model
+
+def warm_screen_model(model):
+    if model is not None:
+        model.predict(np.zeros((1, SCREEN_H, SCREEN_W, 3), dtype=np.float32), verbose=0)
+
+_screen_path = SCREEN_MODEL_PATH if os.path.exists(SCREEN_MODEL_PATH) else MODEL_PATH
+try:
+    screen_slot = ModelSlot("lungs_screen", _screen_path, load_screen_model, warm_screen_model)
+except Exception as e:
+    # Only at startup: the cascade sends every image to the full model until a reload succeeds
+    print(f"Screen model unavailable, cascade disabled: {e}")
+    screen_slot = ModelSlot("lungs_screen", _screen_path, lambda path: None, warm_screen_model)
+    screen_slot.loader = load_screen_model
 
 # -----------------------------
 # IMAGE PREPROCESSING
 # -----------------------------
+def normalize_image(raw_img):
+    x = raw_img.astype(np.float32)
+    x = (x - np.mean(x)) / (np.std(x) + 1e-12)
+    x = np.expand_dims(x, axis=0)
+    return x, raw_img
+
 def load_image_bytes(img_bytes):
     img = Image.open(io.BytesIO(img_bytes)).convert("RGB")  # <-- convert to RGB
     img = img.resize((IMG_H, IMG_W))
-    x = keras_image.img_to_array(img)
-    x = (x - np.mean(x)) / (np.std(x) + 1e-12)
-    x = np.expand_dims(x, axis=0).astype(np.float32)
-    return x, np.array(img).astype(np.uint8)
+    return normalize_image(np.array(img).astype(np.uint8))
+
+def load_image_array(arr):
+    return normalize_image(fit_image_array(arr, (IMG_H, IMG_W)))
+
+def load_image(src):
+    if isinstance(src, np.ndarray):
+        return load_image_array(src)
+    return load_image_bytes(src)
+
+def screen_input(raw_img):
+    small = cv2.resize(np.ascontiguousarray(raw_img), (SCREEN_W, SCREEN_H), interpolation=cv2.INTER_AREA)
+    return normalize_image(small)[0]
 
 
 # -----------------------------
 # PREDICT FUNCTION
 # -----------------------------
 def predict_lungs(img_bytes, threshold=0.01):
-    x, raw_img = load_image_bytes(img_bytes)
-    preds = model.predict(x)[0]
+    x, raw_img = load_image(img_bytes)
+    with lungs_slot.acquire() as model:
+        preds = model.predict(x)[0]
 
     pred_labels = [LABELS[i] for i, p in enumerate(preds) if p >= threshold]
+    report = build_report(pred_labels)
+
+    return preds.tolist(), pred_labels, raw_img, report
 
+def analyze_lungs(img_bytes, threshold=0.01):
+    """predict_lungs plus Grad-CAMs for the found labels, all on one model version."""
+    x, raw_img = load_image(img_bytes)
+    with lungs_slot.borrow() as version:
+        preds = version.model.predict(x)[0]
+        pred_labels = [LABELS[i] for i, p in enumerate(preds) if p >= threshold]
+        cams = compute_gradcams_array(x, pred_labels, version.model) if pred_labels else {}
+
+    return {
+        "preds": preds.tolist(),
+        "labels": pred_labels,
+        "raw_img": raw_img,
+        "report": build_report(pred_labels),
+        "cams": cams,
+        "model_version": version.tag()
+    }
+
+def build_report(pred_labels):
     # BUILD REPORT TEXT
     if pred_labels:
         report = "===== LUNG XRAY ANALYSIS REPORT =====\n\n"
@@ -270,7 +375,95 @@ def predict_lungs(img_bytes, threshold=0.01):
     else:
         report = "No disease detected. The chest X-ray appears NORMAL."
 
-    return preds.tolist(), pred_labels, raw_img, report
+    return report
+
+# -----------------------------
+# CASCADE (screen -> full model)
+# -----------------------------
+def _screen_predict(screen, raw_imgs):
+    if screen is None:
+        return None
+    xs = np.stack([screen_input(raw) for raw in raw_imgs])
+    return screen.predict(xs, verbose=0)
+
+def screen_lungs(raw_imgs):
+    """Screen probabilities for a batch, or None when no screen model is loaded."""
+    with screen_slot.acquire() as screen:
+        return _screen_predict(screen, raw_imgs)
+
+def predict_lungs_cascade(images, threshold=0.01, band=None, with_gradcam=True, use_screen=True):
+    """Run the screen on the whole batch; escalate only images inside the band.
+
+    Images below the band are reported NORMAL with no labels; images above it
+    keep the screen's labels. Returns (results, stats). Each result has the
+    same fields as analyze_lungs plus "stage" ("screen" or "full"), and
+    "model_version" is the version of the model that stage ran; stats
+    counts escalations and throughput.
+    """
+    lo, hi = band or (None, None)
+    band = (CASCADE_BAND[0] if lo is None else lo, CASCADE_BAND[1] if hi is None else hi)
+    if not 0 <= band[0] <= band[1] <= 1:
+        raise ValueError(f"Cascade band must satisfy 0 <= band_lo <= band_hi <= 1, got {band}")
+    start = time.perf_counter()
+    loaded = [load_image(src) for src in images]
+    raw_imgs = [raw for _, raw in loaded]
+
+    # A band covering [0, 1] escalates everything, so the screen would be wasted work
+    use_screen = use_screen and (band[0] > 0 or band[1] < 1)
+    screen_preds, screen_tag = None, None
+    if use_screen:
+        with screen_slot.borrow() as screen_version:
+            screen_preds = _screen_predict(screen_version.model, raw_imgs)
+            screen_tag = screen_version.tag()
+    if screen_preds is None:
+        escalate = np.ones(len(loaded), dtype=bool)
+        cleared = np.zeros(len(loaded), dtype=bool)
+    else:
+        max_prob = screen_preds.max(axis=1)
+        escalate = (max_prob >= band[0]) & (max_prob <= band[1])
+        cleared = max_prob < band[0]
+
+    full_idx = np.flatnonzero(escalate)
+    full_preds, full_cams, full_tag = {}, {}, None
+    if len(full_idx):
+        xs = np.concatenate([loaded[i][0] for i in full_idx])
+        # Predictions and Grad-CAMs of escalated images come from the same version
+        with lungs_slot.borrow() as version:
+            for i, preds in zip(full_idx, version.model.predict(xs, verbose=0)):
+                full_preds[i] = preds
+                labels = [LABELS[j] for j, p in enumerate(preds) if p >= threshold]
+                if with_gradcam and labels:
+                    full_cams[i] = compute_gradcams_array(loaded[i][0], labels, version.model)
+            full_tag = version.tag()
+
+    results = []
+    for i, (x, raw_img) in enumerate(loaded):
+        preds = full_preds[i] if escalate[i] else screen_preds[i]
+        if cleared[i]:
+            labels = []
+        else:
+            labels = [LABELS[j] for j, p in enumerate(preds) if p >= threshold]
+        results.append({
+            "stage": "full" if escalate[i] else "screen",
+            "preds": preds.tolist(),
+            "labels": labels,
+            "raw_img": raw_img,
+            "report": build_report(labels),
+            "cams": full_cams.get(i, {}),
+            "model_version": full_tag if escalate[i] else screen_tag
+        })
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "images": len(loaded),
+        "full_model": int(escalate.sum()),
+        "screened_out": int(len(loaded) - escalate.sum()),
+        "screened_normal": int(cleared.sum()),
+        "band": list(band),
+        "seconds": round(seconds, 4),
+        "images_per_sec": round(len(loaded) / seconds, 2) if seconds > 0 else None
+    }
+    return results, stats
 
 # -----------------------------
 # GRAD-CAM
@@ -297,20 +490,21 @@ def grad_cam(model, image_array, class_index, layer_name='conv5_block16_concat')
         cam /= (cam.max() + 1e-12)
     return cam
 
-def generate_gradcam_images(img_bytes, labels_to_show):
-    x, raw_arr = load_image_bytes(img_bytes)
-    images = {}
-
+def compute_gradcams_array(x, labels_to_show, model=None):
+    """Grad-CAM per label; pass the model a caller already holds to stay on its version."""
+    if model is None:
+        with lungs_slot.acquire() as model:
+            return compute_gradcams_array(x, labels_to_show, model)
+    cams = {}
     for lab in labels_to_show:
         idx = LABELS.index(lab)
-        cam = grad_cam(model, x, idx)
+        cams[lab] = grad_cam(model, x, idx)
+    return cams
 
-        heatmap = cv2.applyColorMap(np.uint8(255 * cam), cv2.COLORMAP_JET)
-        overlay = cv2.addWeighted(raw_arr, 0.6, heatmap, 0.4, 0)
+def compute_gradcams(img_bytes, labels_to_show):
+    x, raw_arr = load_image(img_bytes)
+    return raw_arr, compute_gradcams_array(x, labels_to_show)
 
-        # Encode base64
-        _, buffer = cv2.imencode(".png", overlay)
-        b64 = base64.b64encode(buffer).decode("utf-8")
-        images[lab] = b64
-
-    return images
+def generate_gradcam_images(img_bytes, labels_to_show):
+    raw_arr, cams = compute_gradcams(img_bytes, labels_to_show)
+    return render_gradcam_images(raw_arr, cams)
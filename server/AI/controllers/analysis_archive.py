@@ -0,0 +1,195 @@
+# analysis_archive.py
+import os
+import json
+import time
+import uuid
+import threading
+import fcntl
+import numpy as np
+import cv2
+
+# ---------- Settings ----------
+ARCHIVE_DIR = os.environ.get("ANALYSIS_ARCHIVE_DIR", "archive")
+DATA_FILE = "records.bin"
+INDEX_FILE = "index.jsonl"
+LOCK_FILE = "archive.lock"
+CAM_STORE_SIZE = 56      # lungs CAMs are stored downsampled to 56x56
+JPEG_QUALITY = 90
+
+
+# ---------- Encoding helpers ----------
+def probs_to_f16(probs):
+    return np.asarray(probs, dtype=np.float16)
+
+
+def cam_to_u8(cam, size=None):
+    cam = np.asarray(cam, dtype=np.float32)
+    if size is not None and cam.shape[0] > size:
+        cam = cv2.resize(cam, (size, size), interpolation=cv2.INTER_AREA)
+    return np.uint8(np.clip(cam, 0, 1) * 255 + 0.5)
+
+
+def u8_to_cam(cam_u8):
+    return cam_u8.astype(np.float32) / 255.0
+
+
+def image_to_jpeg(img_uint8):
+    _, buf = cv2.imencode(".jpg", np.ascontiguousarray(img_uint8), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buf.reshape(-1)
+
+
+def jpeg_to_image(buf_u8):
+    return cv2.imdecode(np.asarray(buf_u8), cv2.IMREAD_UNCHANGED)
+
+
+# ---------- Append-only archive ----------
+class AnalysisArchive:
+    """Append-only record store for finished analyses.
+
+    Arrays are written back to back into a single data file; an index line
+    (JSON) records where each array lives. Reads go through a np.memmap of the
+    data file, so retrieving an analysis never touches the models.
+
+    Several server processes may share one archive: appends hold an flock on
+    archive.lock, and a lookup miss re-reads the index lines added since.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.data_path = os.path.join(root, DATA_FILE)
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.lock_path = os.path.join(root, LOCK_FILE)
+        self._lock = threading.Lock()
+        self._index = {}
+        self._index_pos = 0
+        self._mmap = None
+        os.makedirs(root, exist_ok=True)
+        with self._lock:
+            self._load_index()
+
+    def _load_index(self):
+        """Read index lines appended since the last call. Called with the lock held."""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Another process is still writing this line; pick it up next time
+                    break
+                self._index_pos += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partially written line from a crash; skip it
+                    continue
+                self._index[entry["id"]] = entry
+
+    def _data_view(self, end):
+        """Memory-map the data file, remapping only when it has grown past the current map."""
+        if self._mmap is None or self._mmap.shape[0] < end:
+            self._mmap = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        return self._mmap
+
+    def put(self, kind, arrays, meta=None, analysis_id=None):
+        analysis_id = analysis_id or uuid.uuid4().hex
+        fields = {}
+        chunks = []
+        pos = 0
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            fields[name] = {
+                "dtype": arr.dtype.str,
+                "shape": list(arr.shape),
+                "offset": pos,
+                "nbytes": arr.nbytes
+            }
+            chunks.append(arr.tobytes())
+            pos += arr.nbytes
+
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with open(self.data_path, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                for chunk in chunks:
+                    f.write(chunk)
+            entry = {
+                "id": analysis_id,
+                "kind": kind,
+                "offset": offset,
+                "nbytes": pos,
+                "created": time.time(),
+                "arrays": fields,
+                "meta": meta or {}
+            }
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            # Pulls in this entry plus anything other processes appended before it
+            self._load_index()
+        return analysis_id
+
+    def get(self, analysis_id):
+        with self._lock:
+            entry = self._index.get(analysis_id)
+            if entry is None:
+                # Possibly written by another server process since we last looked
+                self._load_index()
+                entry = self._index.get(analysis_id)
+            if entry is None:
+                return None
+            start = entry["offset"]
+            data = self._data_view(start + entry["nbytes"])
+        arrays = {}
+        for name, field in entry["arrays"].items():
+            lo = start + field["offset"]
+            raw = data[lo:lo + field["nbytes"]]
+            arrays[name] = raw.view(np.dtype(field["dtype"])).reshape(field["shape"])
+        return {
+            "id": entry["id"],
+            "kind": entry["kind"],
+            "created": entry["created"],
+            "arrays": arrays,
+            "meta": entry["meta"]
+        }
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            count = len(self._index)
+            data_bytes = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+            index_bytes = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        return {
+            "analyses": count,
+            "data_bytes": data_bytes,
+            "index_bytes": index_bytes,
+            "avg_bytes_per_analysis": round((data_bytes + index_bytes) / count, 1) if count else 0
+        }
+
+
+# ---------- Shared instance ----------
+archive = AnalysisArchive()
+
+
+def archive_lungs(preds, labels, report, raw_img, cams, threshold):
+    label_names = list(cams.keys())
+    arrays = {"probs": probs_to_f16(preds), "image": image_to_jpeg(raw_img)}
+    if label_names:
+        arrays["cams"] = np.stack([cam_to_u8(cams[lab], CAM_STORE_SIZE) for lab in label_names])
+    return archive.put("lungs", arrays, meta={
+        "labels": labels,
+        "cam_labels": label_names,
+        "report": report,
+        "threshold": threshold
+    })
+
+
+def archive_brain(report, probs, heatmap, orig_bgr):
+    return archive.put("brain", {
+        "probs": probs_to_f16(probs),
+        "cam": cam_to_u8(heatmap),
+        "image": image_to_jpeg(orig_bgr)
+    }, meta={"report": report})
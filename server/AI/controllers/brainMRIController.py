@@ -2,12 +2,16 @@ import tensorflow as tf
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import io
 import random
 import pandas as pd
 from tensorflow.keras.preprocessing import image
 from tensorflow.keras.applications.efficientnet_v2 import preprocess_input
 from tabulate import tabulate
 import tempfile
+from PIL import Image
+from controllers.raw_input import fit_image_array
+from controllers.model_slot import ModelSlot
 
 # Disable unnecessary GUI backend
 plt.switch_backend('Agg')
@@ -24,15 +28,24 @@ CLASS_NAMES = sorted([d for d in os.listdir(train_dir) if os.path.isdir(os.path.
 VALID_CLASSES = {"glioma", "meningioma", "notumor", "pituitary"}
 print("✅ Loaded Classes:", CLASS_NAMES)
 
-# ===== Load Model =====
-assert os.path.exists(save_model_path), f"❌ Model file not found: {save_model_path}"
+# ===== Load Model (hot-reloadable slot) =====
+def load_brain_model(path):
+    assert os.path.exists(path), f"❌ Model file not found: {path}"
 
-try:
-    model = tf.keras.models.load_model(save_model_path)
-except Exception:
-    model = tf.keras.models.load_model(save_model_path, safe_mode=False, compile=False)
+    try:
+        model = tf.keras.models.load_model(path)
+    except Exception:
+        model = tf.keras.models.load_model(path, safe_mode=False, compile=False)
 
-print("✅ Model loaded successfully!")
+    print("✅ Model loaded successfully!")
+    return model
+
+
+def warm_brain_model(model):
+    model.predict(np.zeros((1, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.float32), verbose=0)
+
+
+brain_slot = ModelSlot("brain", save_model_path, load_brain_model, warm_brain_model)
 
 
 # ===== MRI REPORT =====
@@ -167,18 +180,35 @@ def generate_report(pred_class, confidence, img_path):
 
 
 # ===== Prediction Function (used in API) =====
-def predict_mri(file):
-    # Save temp file
-    temp_path = os.path.join(tempfile.gettempdir(), file.filename)
-    file.save(temp_path)
+def load_mri_array(arr):
+    # Same nearest-neighbour resize as image.load_img
+    arr = fit_image_array(arr, IMG_SIZE, Image.NEAREST)
+    img_array = np.expand_dims(arr.astype(np.float32), axis=0)
+    return preprocess_input(img_array)
 
-    # Load and preprocess
-    img = image.load_img(temp_path, target_size=IMG_SIZE)
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
 
-    preds = model.predict(img_array)
+def predict_mri(file):
+    if isinstance(file, np.ndarray):
+        temp_path = None
+        img_array = load_mri_array(file)
+    else:
+        if isinstance(file, bytes):
+            # Raw upload bytes (also what a pinned worker process receives); no temp file
+            temp_path = None
+            img = image.load_img(io.BytesIO(file), target_size=IMG_SIZE)
+        else:
+            # Save temp file
+            temp_path = os.path.join(tempfile.gettempdir(), file.filename)
+            file.save(temp_path)
+
+            # Load and preprocess
+            img = image.load_img(temp_path, target_size=IMG_SIZE)
+        img_array = image.img_to_array(img)
+        img_array = np.expand_dims(img_array, axis=0)
+        img_array = preprocess_input(img_array)
+
+    with brain_slot.borrow() as version:
+        preds = version.model.predict(img_array)
     pred_idx = np.argmax(preds, axis=1)[0]
     confidence = float(np.max(preds) * 100)
     pred_class = CLASS_NAMES[pred_idx]
@@ -188,5 +218,7 @@ def predict_mri(file):
     return {
         "prediction": pred_class,
         "confidence": confidence,
+        "probabilities": preds[0].tolist(),
+        "model_version": version.tag(),
         "report": report
     }
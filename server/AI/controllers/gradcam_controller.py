@@ -1,39 +1,42 @@
 # gradcam_controller.py
 import tensorflow as tf
 import numpy as np
-import cv2
 from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
 from io import BytesIO
 from PIL import Image
+from controllers.raw_input import fit_image_array
+from controllers.model_slot import ModelSlot
+from controllers.overlays import combine_images
 
 # ---------- Settings ----------
 MODEL_PATH = "models/best_brain_tumor_effv2b2_260.keras"
 IMG_SIZE = (260, 260)
 
-# ---------- Load model once ----------
-best_model = load_model(MODEL_PATH)
-print("✅ Model loaded:", best_model.name)
-
-# ---------- Extract the base EfficientNet model ----------
-base_model = best_model.get_layer("efficientnetv2-b2")
-print("✅ Nested base model found:", base_model.name)
-
-# ---------- Get last conv layer ----------
-last_conv = None
-for layer in reversed(base_model.layers):
-    if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D)):
-        last_conv = layer
-        break
-if last_conv is None:
-    raise ValueError("❌ No conv layer found in EfficientNet base")
-print("✅ Last conv layer inside EfficientNet base:", last_conv.name)
-
-# ---------- Build Grad-CAM model ----------
-grad_model = tf.keras.models.Model(
-    inputs=base_model.input,
-    outputs=[last_conv.output, base_model.output]
-)
+# ---------- Load model (called for every version of the slot) ----------
+def load_gradcam_models(path):
+    best_model = load_model(path)
+    print("✅ Model loaded:", best_model.name)
+
+    # ---------- Extract the base EfficientNet model ----------
+    base_model = best_model.get_layer("efficientnetv2-b2")
+    print("✅ Nested base model found:", base_model.name)
+
+    # ---------- Get last conv layer ----------
+    last_conv = None
+    for layer in reversed(base_model.layers):
+        if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D)):
+            last_conv = layer
+            break
+    if last_conv is None:
+        raise ValueError("❌ No conv layer found in EfficientNet base")
+    print("✅ Last conv layer inside EfficientNet base:", last_conv.name)
+
+    # ---------- Build Grad-CAM model ----------
+    grad_model = tf.keras.models.Model(
+        inputs=base_model.input,
+        outputs=[last_conv.output, base_model.output]
+    )
+    return best_model, grad_model
 
 # ---------- Grad-CAM++ Function ----------
 def gradcam_plus_plus(grad_model, img_tensor, class_idx):
@@ -68,31 +71,73 @@ def gradcam_plus_plus(grad_model, img_tensor, class_idx):
     return heatmap
 
 
+def warm_gradcam_models(models):
+    best_model, grad_model = models
+    x = tf.zeros((1, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=tf.float32)
+    best_model.predict(x, verbose=0)
+    gradcam_plus_plus(grad_model, x, 0)
+
+
+gradcam_slot = ModelSlot("brain_gradcam", MODEL_PATH, load_gradcam_models, warm_gradcam_models)
+
+
 # ---------- Test-Time Augmentation ----------
-def get_tta_heatmap(model, grad_model, img_tensor, pred_class, angles=[0, 90, 180, 270], flip=True):
-    heatmaps = []
+def _tta_views(angles, flip):
+    views = []
     for angle in angles:
-        img_rot = tf.image.rot90(img_tensor, k=angle // 90)
-        heatmap = gradcam_plus_plus(grad_model, img_rot, pred_class)
-        heatmap = np.rot90(heatmap, k=(4 - angle // 90))
-        heatmaps.append(heatmap)
+        views.append((angle, False))
         if flip:
-            img_flip = tf.image.flip_left_right(img_rot)
-            heatmap_flip = gradcam_plus_plus(grad_model, img_flip, pred_class)
-            heatmap_flip = np.fliplr(np.rot90(heatmap_flip, k=(4 - angle // 90)))
-            heatmaps.append(heatmap_flip)
-    heatmap_avg = np.mean(np.stack(heatmaps), axis=0)
-    heatmap_avg = np.maximum(heatmap_avg, 0)
-    heatmap_avg /= (np.max(heatmap_avg) + 1e-8)
-    return heatmap_avg
+            views.append((angle, True))
+    return views
+
+
+def _tta_view_heatmap(grad_model, img_tensor, pred_class, angle, flipped):
+    k = angle // 90
+    img_view = tf.image.rot90(img_tensor, k=k)
+    if flipped:
+        img_view = tf.image.flip_left_right(img_view)
+    heatmap = gradcam_plus_plus(grad_model, img_view, pred_class)
+    heatmap = np.rot90(heatmap, k=(4 - k))
+    if flipped:
+        heatmap = np.fliplr(heatmap)
+    return heatmap
 
-# ---------- Overlay Function ----------
-def overlay_on_image(orig_bgr_uint8, heatmap, alpha=0.5):
-    hmap = cv2.resize(heatmap, (orig_bgr_uint8.shape[1], orig_bgr_uint8.shape[0]))
-    hmap = np.uint8(255 * hmap)
-    hmap_color = cv2.applyColorMap(hmap, cv2.COLORMAP_JET)
-    overlay = cv2.addWeighted(orig_bgr_uint8, 1 - alpha, hmap_color, alpha, 0)
-    return hmap_color, overlay
+
+def _normalize_heatmap(heatmap):
+    heatmap = np.maximum(heatmap, 0)
+    return heatmap / (np.max(heatmap) + 1e-8)
+
+
+def iter_tta_heatmaps(grad_model, img_tensor, pred_class, angles=[0, 90, 180, 270], flip=True,
+                      tol=None, min_views=2):
+    """Yield (heatmap, views_done, total_views, delta, done) after every TTA view.
+
+    The heatmap is the normalized running mean of the views computed so far and
+    delta is the largest per-pixel change from the previous running mean. When
+    tol is set, iteration stops once delta drops below it (after min_views);
+    done is True on the last item either way.
+    """
+    views = _tta_views(angles, flip)
+    running_sum = None
+    prev = None
+    for n, (angle, flipped) in enumerate(views, start=1):
+        heatmap = _tta_view_heatmap(grad_model, img_tensor, pred_class, angle, flipped)
+        running_sum = heatmap if running_sum is None else running_sum + heatmap
+        current = _normalize_heatmap(running_sum / n)
+        delta = None if prev is None else float(np.max(np.abs(current - prev)))
+        converged = tol is not None and delta is not None and n >= min_views and delta < tol
+        done = converged or n == len(views)
+        yield current, n, len(views), delta, done
+        if done:
+            return
+        prev = current
+
+
+def get_tta_heatmap(model, grad_model, img_tensor, pred_class, angles=[0, 90, 180, 270], flip=True, tol=None):
+    heatmap_avg = None
+    for heatmap_avg, _, _, _, _ in iter_tta_heatmaps(grad_model, img_tensor, pred_class, angles, flip, tol=tol):
+        pass
+    return heatmap_avg
 
 # ---------- Main function to call from Flask ----------
 # def predict_and_gradcam(file_stream):
@@ -120,37 +165,83 @@ def overlay_on_image(orig_bgr_uint8, heatmap, alpha=0.5):
 #         "overlay": overlay
 #     }
 
-# ---------- Main function to call from Flask ----------
-def predict_and_gradcam(file_stream):
+# ---------- Preprocessing ----------
+def preprocess_image_bytes(file_stream):
     pil = Image.open(BytesIO(file_stream)).convert("RGB")
     pil_resized = pil.resize(IMG_SIZE)
-    
-    x = image.img_to_array(pil_resized)
+    return preprocess_image_array(np.array(pil_resized))
+
+
+def preprocess_image_array(arr):
+    arr = fit_image_array(arr, IMG_SIZE)
+
+    x = arr.astype(np.float32)
     x = np.expand_dims(x, 0)
     x = x / 255.0
     x = tf.keras.applications.efficientnet_v2.preprocess_input(x)
 
     # Original image in BGR for OpenCV
-    orig_bgr = np.array(pil.resize(IMG_SIZE))[:, :, ::-1] 
+    orig_bgr = arr[:, :, ::-1]
+    return x, orig_bgr
+
 
-    # Predict
-    pred = best_model.predict(x)
-    pred_class = int(np.argmax(pred[0]))
+def preprocess_input_image(src):
+    if isinstance(src, np.ndarray):
+        return preprocess_image_array(src)
+    return preprocess_image_bytes(src)
 
-    # Grad-CAM++
-    img_tensor = tf.convert_to_tensor(x, dtype=tf.float32)
-    heatmap = get_tta_heatmap(best_model, grad_model, img_tensor, pred_class)
-    hmap_color, overlay = overlay_on_image(orig_bgr, heatmap)
 
-    # ---------- Combine Images Horizontally ----------
-    combined = np.concatenate([
-        orig_bgr,       # Original MRI
-        hmap_color,     # Grad-CAM++ Heatmap
-        overlay         # Overlay
-    ], axis=1)  # axis=1 means horizontal concatenation
+# ---------- Main function to call from Flask ----------
+def predict_and_gradcam(file_stream, tol=None):
+    x, orig_bgr = preprocess_input_image(file_stream)
+
+    with gradcam_slot.borrow() as version:
+        best_model, grad_model = version.model
+        # Predict
+        pred = best_model.predict(x)
+        pred_class = int(np.argmax(pred[0]))
+
+        # Grad-CAM++
+        img_tensor = tf.convert_to_tensor(x, dtype=tf.float32)
+        heatmap = get_tta_heatmap(best_model, grad_model, img_tensor, pred_class, tol=tol)
+    combined = combine_images(orig_bgr, heatmap)
 
     return {
         "pred_class": pred_class,
         "pred_prob": float(pred[0, pred_class]),
+        "model_version": version.tag(),
+        "heatmap": heatmap,
+        "orig_bgr": orig_bgr,
         "combined_image": combined
     }
+
+
+# ---------- Progressive version for streaming routes ----------
+def predict_and_gradcam_stream(file_stream, tol=None):
+    """Same as predict_and_gradcam, but yields a result after every TTA view.
+
+    The first result is a coarse single-view heatmap; later ones refine it.
+    The last yielded result has "done": True.
+    """
+    x, orig_bgr = preprocess_input_image(file_stream)
+
+    # The whole stream stays on one model version, even if a reload swaps it meanwhile
+    with gradcam_slot.borrow() as version:
+        best_model, grad_model = version.model
+        pred = best_model.predict(x)
+        pred_class = int(np.argmax(pred[0]))
+
+        img_tensor = tf.convert_to_tensor(x, dtype=tf.float32)
+        for heatmap, views_done, total_views, delta, done in iter_tta_heatmaps(grad_model, img_tensor, pred_class, tol=tol):
+            yield {
+                "pred_class": pred_class,
+                "pred_prob": float(pred[0, pred_class]),
+                "model_version": version.tag(),
+                "views_done": views_done,
+                "total_views": total_views,
+                "delta": delta,
+                "done": done,
+                "heatmap": heatmap,
+                "orig_bgr": orig_bgr,
+                "combined_image": combine_images(orig_bgr, heatmap)
+            }
@@ -0,0 +1,200 @@
+# model_slot.py
+import gc
+import os
+import time
+import threading
+from contextlib import contextmanager, ExitStack
+
+# ---------- Registry of all model slots (name -> ModelSlot) ----------
+SLOTS = {}
+
+
+class _ModelVersion:
+    def __init__(self, number, path, model):
+        self.number = number
+        self.path = path
+        self.model = model
+        self.loaded_at = time.time()
+        self.mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        self.refs = 0
+        self.retired = False
+
+    def info(self):
+        return {
+            "version": self.number,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "file_mtime": self.mtime,
+            "in_flight": self.refs
+        }
+
+    def tag(self):
+        """Short version record to attach to a response."""
+        return {"version": self.number, "path": self.path}
+
+
+class ModelSlot:
+    """Double-buffered holder for a loaded model.
+
+    Requests borrow the active version with `with slot.acquire() as model:`.
+    reload() loads and warms a new version in a background thread, then swaps
+    it in under the lock. Requests that already hold the old version finish on
+    it; the old version is dropped once its last request releases it, after
+    on_release(model) has been called (with the slot lock held, keep it short).
+    """
+
+    def __init__(self, name, path, loader, warmup=None, on_release=None):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.on_release = on_release
+        self._lock = threading.Lock()
+        self._active = None
+        self._retired = []
+        self._next_number = 1
+        self._reloading = False
+        self._last_error = None
+        self._swap(self._load(path))
+        SLOTS[name] = self
+
+    # ---------- Loading ----------
+    def _load(self, path):
+        with self._lock:
+            number = self._next_number
+            self._next_number += 1
+        model = self.loader(path)
+        if self.warmup is not None:
+            self.warmup(model)
+        return _ModelVersion(number, path, model)
+
+    def _swap_locked(self, version):
+        old = self._active
+        self._active = version
+        if old is not None:
+            old.retired = True
+            if old.refs == 0:
+                self._free(old)
+            else:
+                self._retired.append(old)
+
+    def _swap(self, version):
+        with self._lock:
+            self._swap_locked(version)
+        print(f"✅ [{self.name}] model version {version.number} active ({version.path})")
+
+    def _free(self, version):
+        # Called with the lock held
+        if version in self._retired:
+            self._retired.remove(version)
+        if self.on_release is not None:
+            self.on_release(version.model)
+        version.model = None
+        print(f"✅ [{self.name}] released model version {version.number}")
+
+    def _begin_reload(self, path=None):
+        """Claim the slot for a reload; returns the path to load, or None if one is running."""
+        with self._lock:
+            if self._reloading:
+                return None
+            self._reloading = True
+            return path or self._active.path
+
+    def _end_reload(self, error=None):
+        with self._lock:
+            self._reloading = False
+            self._last_error = error
+
+    def reload(self, path=None, background=True):
+        """Start loading a new version; returns False if a reload is already running."""
+        return reload_together([self], [path], background)
+
+    # ---------- Borrowing ----------
+    @contextmanager
+    def borrow(self):
+        """Like acquire(), but yields the version record (.model, .number, .path)."""
+        with self._lock:
+            version = self._active
+            version.refs += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.refs -= 1
+                if version.retired and version.refs == 0:
+                    self._free(version)
+
+    @contextmanager
+    def acquire(self):
+        with self.borrow() as version:
+            yield version.model
+
+    def status(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "active": self._active.info(),
+                "draining": [v.info() for v in self._retired],
+                "reloading": self._reloading,
+                "last_error": self._last_error
+            }
+
+
+def reload_together(slots, paths=None, background=True):
+    """Load new versions for all slots, then swap them in one step.
+
+    paths lines up with slots; a missing or None entry reloads that slot's
+    current file. Slots that serve one request together (e.g. the brain
+    report and Grad-CAM copies) never sit on different versions longer than
+    the swap itself. Returns False without doing anything if any slot is
+    already reloading.
+    """
+    requested = list(paths or [])
+    requested += [None] * (len(slots) - len(requested))
+    paths = []
+    for slot, path in zip(slots, requested):
+        p = slot._begin_reload(path)
+        if p is None:
+            for claimed in slots[:len(paths)]:
+                claimed._end_reload(claimed._last_error)
+            return False
+        paths.append(p)
+
+    def work():
+        error = None
+        try:
+            versions = [slot._load(p) for slot, p in zip(slots, paths)]
+            with ExitStack() as stack:
+                for slot in sorted(slots, key=lambda s: s.name):
+                    stack.enter_context(slot._lock)
+                for slot, version in zip(slots, versions):
+                    slot._swap_locked(version)
+            for slot, version in zip(slots, versions):
+                print(f"✅ [{slot.name}] model version {version.number} active ({version.path})")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"❌ [{', '.join(s.name for s in slots)}] reload failed: {error}")
+        finally:
+            for slot in slots:
+                slot._end_reload(error)
+            gc.collect()
+
+    if background:
+        threading.Thread(target=work, name=f"reload-{'+'.join(s.name for s in slots)}", daemon=True).start()
+    else:
+        work()
+    return True
+
+
+def models_status():
+    return {name: slot.status() for name, slot in SLOTS.items()}
+
+
+def reload_slots(names, paths=None):
+    """Reload the named slots together; the same result for each name.
+
+    paths maps a slot name to the file it should load; names left out
+    reload their current file.
+    """
+    paths = paths or {}
+    started = reload_together([SLOTS[name] for name in names], [paths.get(name) for name in names])
+    return {name: started for name in names}
@@ -0,0 +1,43 @@
+# overlays.py
+# Heatmap overlays shared by the controllers and the archive route.
+# Only OpenCV/NumPy here, so rendering never loads a model.
+import base64
+import numpy as np
+import cv2
+
+
+# ---------- Overlay Function ----------
+def overlay_on_image(orig_bgr_uint8, heatmap, alpha=0.5):
+    hmap = cv2.resize(heatmap, (orig_bgr_uint8.shape[1], orig_bgr_uint8.shape[0]))
+    hmap = np.uint8(255 * hmap)
+    hmap_color = cv2.applyColorMap(hmap, cv2.COLORMAP_JET)
+    overlay = cv2.addWeighted(orig_bgr_uint8, 1 - alpha, hmap_color, alpha, 0)
+    return hmap_color, overlay
+
+
+def combine_images(orig_bgr, heatmap):
+    hmap_color, overlay = overlay_on_image(orig_bgr, heatmap)
+
+    # ---------- Combine Images Horizontally ----------
+    return np.concatenate([
+        orig_bgr,       # Original MRI
+        hmap_color,     # Grad-CAM++ Heatmap
+        overlay         # Overlay
+    ], axis=1)  # axis=1 means horizontal concatenation
+
+
+# ---------- Lungs overlays (base64 PNG per label) ----------
+def render_gradcam_images(raw_arr, cams):
+    images = {}
+
+    for lab, cam in cams.items():
+        cam = cv2.resize(cam, (raw_arr.shape[1], raw_arr.shape[0]))
+        heatmap = cv2.applyColorMap(np.uint8(255 * cam), cv2.COLORMAP_JET)
+        overlay = cv2.addWeighted(raw_arr, 0.6, heatmap, 0.4, 0)
+
+        # Encode base64
+        _, buffer = cv2.imencode(".png", overlay)
+        b64 = base64.b64encode(buffer).decode("utf-8")
+        images[lab] = b64
+
+    return images
@@ -0,0 +1,384 @@
+# placement.py
+import os
+import json
+import ctypes
+import time
+import threading
+import importlib
+import multiprocessing
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ---------- Model groups (which controller modules share a process) ----------
+GROUP_MODULES = {
+    "brain": ["controllers.brainMRIController", "controllers.gradcam_controller"],
+    "lungs": ["controllers.Lungs"]
+}
+MODULE_GROUP = {m: group for group, modules in GROUP_MODULES.items() for m in modules}
+
+# ---------- Settings ----------
+# Per-group placement, e.g.
+#   {"brain": {"node": 0}, "lungs": {"cpus": "16-31", "intra_op_threads": 16, "inter_op_threads": 2}}
+# A placed group runs in its own worker process(es) pinned to those CPUs, with
+# TensorFlow thread pools sized to match. Groups left out run in the Flask
+# process as before.
+PLACEMENT_FILE = os.environ.get("MODEL_PLACEMENT_FILE", "placement.json")
+# How often a stream checks that its worker is still alive while waiting for the next item
+STREAM_POLL_SECONDS = 1.0
+# How long a status or reload call waits for a worker's control thread to answer
+CONTROL_TIMEOUT = float(os.environ.get("MODEL_CONTROL_TIMEOUT", "30"))
+
+WORKERS = {}
+
+
+def load_placement_config():
+    raw = os.environ.get("MODEL_PLACEMENT")
+    if raw:
+        return json.loads(raw)
+    if os.path.exists(PLACEMENT_FILE):
+        with open(PLACEMENT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+# ---------- CPU sets ----------
+def parse_cpu_list(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11] (Linux cpulist format)."""
+    cpus = []
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def numa_node_cpus(node):
+    with open(f"/sys/devices/system/node/node{node}/cpulist", "r") as f:
+        return parse_cpu_list(f.read())
+
+
+def resolve_cpus(entry):
+    if "cpus" in entry:
+        cpus = entry["cpus"] if isinstance(entry["cpus"], list) else parse_cpu_list(entry["cpus"])
+    elif "node" in entry:
+        cpus = numa_node_cpus(entry["node"])
+    else:
+        return []
+    available = os.sched_getaffinity(0)
+    cpus = [c for c in cpus if c in available]
+    if not cpus:
+        raise ValueError(f"Placement {entry} has no CPUs available to this process")
+    return cpus
+
+
+def thread_counts(entry, cpus, processes):
+    intra = entry.get("intra_op_threads") or max(1, len(cpus) // processes)
+    inter = entry.get("inter_op_threads") or 2
+    return intra, inter
+
+
+def bind_memory(node):
+    """Prefer allocations on the given NUMA node (libnuma if present).
+
+    Pinning the CPUs before the models load already keeps most pages local
+    through first-touch; this only makes it explicit.
+    """
+    try:
+        libnuma = ctypes.CDLL("libnuma.so.1")
+        if libnuma.numa_available() < 0:
+            return False
+        libnuma.numa_set_preferred(int(node))
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def apply_placement(entry, processes=1):
+    """Pin this process and size TensorFlow's thread pools. Call before TensorFlow runs any op."""
+    cpus = resolve_cpus(entry)
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    if "node" in entry and entry.get("membind", True):
+        bind_memory(entry["node"])
+
+    intra, inter = thread_counts(entry, cpus or sorted(os.sched_getaffinity(0)), processes)
+    os.environ["OMP_NUM_THREADS"] = str(intra)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter)
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra)
+    tf.config.threading.set_inter_op_parallelism_threads(inter)
+    return {"cpus": cpus, "intra_op_threads": intra, "inter_op_threads": inter}
+
+
+# ---------- Worker processes ----------
+def _serve_control(conn):
+    """Answer status and reload calls in a worker without queueing behind inference."""
+    while True:
+        try:
+            seq, module, func, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (seq, "ok", _call(module, func, args, kwargs))
+        except Exception as e:
+            reply = (seq, "error", f"{type(e).__name__}: {e}")
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send((seq, "error", f"{type(e).__name__}: {e}"))
+
+
+def _init_worker(group, entry, processes, control=None):
+    placed = apply_placement(entry, processes)
+    print(f"✅ [{group}] worker {os.getpid()} pinned to {len(placed['cpus'])} CPUs "
+          f"(intra={placed['intra_op_threads']}, inter={placed['inter_op_threads']})")
+    if control is not None:
+        threading.Thread(target=_serve_control, args=(control,), name="model-control", daemon=True).start()
+    for module in GROUP_MODULES[group]:
+        importlib.import_module(module)
+
+
+def _call(module, func, args, kwargs):
+    return getattr(importlib.import_module(module), func)(*args, **kwargs)
+
+
+def _stream_to_queue(module, func, queue, args, kwargs):
+    try:
+        for item in _call(module, func, args, kwargs):
+            queue.put(("item", item))
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        queue.put(("end", None))
+
+
+def _ready():
+    return os.getpid()
+
+
+def split_cpus(cpus, parts):
+    """Split a CPU list into `parts` contiguous, near-equal chunks."""
+    size, extra = divmod(len(cpus), parts)
+    chunks, pos = [], 0
+    for i in range(parts):
+        n = size + (1 if i < extra else 0)
+        chunks.append(cpus[pos:pos + n])
+        pos += n
+    return chunks
+
+
+class ModelWorker:
+    """Pinned worker process(es) that own one model group.
+
+    With "processes": N the group's CPU set is split into N disjoint chunks,
+    one single-process executor per chunk; calls go to the least busy one.
+    Each process runs one call at a time, and a stream holds its process
+    until it ends, so "processes" is what sets a group's request concurrency.
+    Status and reload calls (broadcast) skip that queue: they go over a pipe
+    to a control thread in each process. A process that dies is replaced on
+    the next call that notices it.
+    """
+
+    def __init__(self, group, entry):
+        self.group = group
+        self.entry = entry
+        processes = int(entry.get("processes", 1))
+        cpus = resolve_cpus(entry) or sorted(os.sched_getaffinity(0))
+        if processes > len(cpus):
+            raise ValueError(f"[{group}] {processes} processes need at least as many CPUs, got {len(cpus)}")
+        self._ctx = multiprocessing.get_context("spawn")
+        self._manager = self._ctx.Manager()
+        self._lock = threading.Lock()
+        self.chunks = []
+        for chunk in split_cpus(cpus, processes):
+            chunk_entry = dict(entry, cpus=chunk)
+            if processes > 1:
+                chunk_entry.pop("intra_op_threads", None)
+            self.chunks.append(chunk_entry)
+        self.executors = [None] * len(self.chunks)
+        self.controls = [None] * len(self.chunks)
+        self._control_locks = [threading.Lock() for _ in self.chunks]
+        self._control_seq = 0
+        self.pids = [None] * len(self.chunks)
+        self._busy = [0] * len(self.chunks)
+        ready = [self._start_process(i) for i in range(len(self.chunks))]
+        # Block until every process has loaded and warmed its models
+        self.pids = [f.result() for f in ready]
+
+    def _start_process(self, i):
+        """(Re)create process i; returns a future for its pid, set once its models are loaded."""
+        control, worker_control = self._ctx.Pipe()
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=self._ctx, initializer=_init_worker,
+                                       initargs=(self.group, self.chunks[i], 1, worker_control))
+        self.executors[i] = executor
+        self.controls[i] = control
+
+        def started(f):
+            # The process holds its own copy now; closing ours lets recv() see it exit
+            worker_control.close()
+            if not f.cancelled() and f.exception() is None and self.executors[i] is executor:
+                self.pids[i] = f.result()
+        ready = executor.submit(_ready)
+        ready.add_done_callback(started)
+        return ready
+
+    def _restart(self, i, executor):
+        """Replace process i once its pool is broken; a broken pool never recovers."""
+        with self._lock:
+            if self.executors[i] is not executor:
+                return  # another request already replaced it
+            print(f"❌ [{self.group}] worker {self.pids[i]} died; starting a new one")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._start_process(i)
+
+    def _result(self, i, executor, future):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._restart(i, executor)
+            raise
+
+    def _submit(self, fn, *args):
+        """Returns (process index, executor, future)."""
+        for attempt in range(2):
+            with self._lock:
+                i = min(range(len(self.executors)), key=self._busy.__getitem__)
+                self._busy[i] += 1
+                executor = self.executors[i]
+            try:
+                future = executor.submit(fn, *args)
+                break
+            except BrokenProcessPool:
+                # The process died during an earlier call; retry once on its replacement
+                with self._lock:
+                    self._busy[i] -= 1
+                self._restart(i, executor)
+                if attempt:
+                    raise
+
+        def done(_):
+            with self._lock:
+                self._busy[i] -= 1
+        future.add_done_callback(done)
+        return i, executor, future
+
+    def call(self, module, func, *args, **kwargs):
+        return self._result(*self._submit(_call, module, func, args, kwargs))
+
+    def control(self, i, module, func, *args, **kwargs):
+        """Run a short call on process i's control thread, beside any running inference."""
+        with self._control_locks[i]:
+            conn = self.controls[i]
+            self._control_seq += 1
+            seq = self._control_seq
+            deadline = time.monotonic() + CONTROL_TIMEOUT
+            try:
+                conn.send((seq, module, func, args, kwargs))
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not conn.poll(remaining):
+                        raise TimeoutError(f"[{self.group}] worker {self.pids[i]} did not answer {func} "
+                                           f"within {CONTROL_TIMEOUT:g}s")
+                    reply_seq, kind, value = conn.recv()
+                    if reply_seq == seq:
+                        break
+                    # A late answer to a call that already timed out
+            except (EOFError, OSError):
+                raise RuntimeError(f"[{self.group}] worker {self.pids[i]} is not running")
+        if kind == "error":
+            raise RuntimeError(value)
+        return value
+
+    def broadcast(self, module, func, *args, **kwargs):
+        """Run the call in every process of the group (e.g. model status and reloads)."""
+        return [self.control(i, module, func, *args, **kwargs) for i in range(len(self.executors))]
+
+    def stream(self, module, func, *args, **kwargs):
+        queue = self._manager.Queue()
+        i, executor, future = self._submit(_stream_to_queue, module, func, queue, args, kwargs)
+        while True:
+            # Everything a finished call put on the queue is already there
+            finished = future.done()
+            try:
+                kind, item = queue.get(timeout=STREAM_POLL_SECONDS)
+            except Empty:
+                if not finished:
+                    continue
+                # The worker died, or the call never ran (e.g. its arguments did not pickle)
+                self._result(i, executor, future)
+                raise RuntimeError(f"[{self.group}] {func} stopped without finishing its stream")
+            if kind == "item":
+                yield item
+            elif kind == "error":
+                raise RuntimeError(item)
+            else:
+                break
+        self._result(i, executor, future)
+
+    def info(self):
+        processes = []
+        for pid, chunk in zip(self.pids, self.chunks):
+            intra, inter = thread_counts(chunk, chunk["cpus"], 1)
+            processes.append({"pid": pid, "cpus": chunk["cpus"], "intra_op_threads": intra, "inter_op_threads": inter})
+        return {"node": self.entry.get("node"), "processes": processes}
+
+    def shutdown(self):
+        for ex in self.executors:
+            ex.shutdown()
+        for conn in self.controls:
+            conn.close()
+        self._manager.shutdown()
+
+
+# ---------- Entry points used by app.py ----------
+def start(config=None):
+    """Start pinned workers for placed groups and load the rest in-process."""
+    if multiprocessing.parent_process() is not None:
+        # A spawned worker re-imports the app module; it must not start workers of its own
+        return
+    config = load_placement_config() if config is None else config
+    for group, modules in GROUP_MODULES.items():
+        if group in config:
+            WORKERS[group] = ModelWorker(group, config[group])
+        else:
+            for module in modules:
+                importlib.import_module(module)
+
+
+def call_in_group(group, module, func, *args, **kwargs):
+    worker = WORKERS.get(group)
+    if worker is not None:
+        return worker.call(module, func, *args, **kwargs)
+    return getattr(importlib.import_module(module), func)(*args, **kwargs)
+
+
+def broadcast_to_group(group, module, func, *args, **kwargs):
+    """One result per process that holds the group's models."""
+    worker = WORKERS.get(group)
+    if worker is not None:
+        return worker.broadcast(module, func, *args, **kwargs)
+    return [getattr(importlib.import_module(module), func)(*args, **kwargs)]
+
+
+def run(module, func, *args, **kwargs):
+    """Call a controller function wherever its model group lives."""
+    return call_in_group(MODULE_GROUP[module], module, func, *args, **kwargs)
+
+
+def stream(module, func, *args, **kwargs):
+    worker = WORKERS.get(MODULE_GROUP[module])
+    if worker is not None:
+        return worker.stream(module, func, *args, **kwargs)
+    return getattr(importlib.import_module(module), func)(*args, **kwargs)
+
+
+def placement_status():
+    return {group: (WORKERS[group].info() if group in WORKERS else "in-process") for group in GROUP_MODULES}
@@ -0,0 +1,86 @@
+# raw_input.py
+import io
+import numpy as np
+from PIL import Image
+
+# ---------- Settings ----------
+NPY_CONTENT_TYPE = "application/x-npy"
+RAW_CONTENT_TYPE = "application/octet-stream"
+SHAPE_HEADER = "X-Image-Shape"
+
+
+# ---------- Detect raw requests ----------
+def is_raw_request(req):
+    return req.mimetype in (NPY_CONTENT_TYPE, RAW_CONTENT_TYPE)
+
+
+def _check_image_shape(shape):
+    if any(d <= 0 for d in shape):
+        raise ValueError(f"Image dimensions must be positive, got shape {tuple(shape)}")
+    if len(shape) == 2 or (len(shape) == 3 and shape[2] in (1, 3)):
+        return
+    raise ValueError(f"Expected an HxW, HxWx1 or HxWx3 image, got shape {tuple(shape)}")
+
+
+# ---------- Decode without copying ----------
+def decode_npy(body):
+    """Wrap an .npy payload with np.frombuffer; only the header is parsed."""
+    f = io.BytesIO(body)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype != np.uint8:
+        raise ValueError(f"Expected a uint8 array, got {dtype}")
+    if fortran_order:
+        raise ValueError("Fortran-ordered arrays are not supported")
+    _check_image_shape(shape)
+    count = int(np.prod(shape))
+    if len(body) - f.tell() != count:
+        raise ValueError("NPY payload size does not match its header")
+    return np.frombuffer(body, dtype=np.uint8, count=count, offset=f.tell()).reshape(shape)
+
+
+def decode_raw(body, shape_header):
+    """Wrap a raw uint8 HxW[xC] payload described by the X-Image-Shape header."""
+    if not shape_header:
+        raise ValueError(f"Missing {SHAPE_HEADER} header (e.g. '224,224,3')")
+    try:
+        shape = tuple(int(s) for s in shape_header.replace("x", ",").split(","))
+    except ValueError:
+        raise ValueError(f"Invalid {SHAPE_HEADER} header: {shape_header}")
+    _check_image_shape(shape)
+    if len(body) != int(np.prod(shape)):
+        raise ValueError(f"Body has {len(body)} bytes, {SHAPE_HEADER} {shape_header} needs {int(np.prod(shape))}")
+    return np.frombuffer(body, dtype=np.uint8).reshape(shape)
+
+
+def read_raw_image(req):
+    """Return the request body as a read-only uint8 image array (no decode, no copy)."""
+    body = req.get_data(cache=True)
+    if req.mimetype == NPY_CONTENT_TYPE:
+        return decode_npy(body)
+    return decode_raw(body, req.headers.get(SHAPE_HEADER))
+
+
+def to_rgb(arr):
+    """Grayscale inputs are expanded to 3 channels; RGB inputs are returned as is."""
+    if arr.ndim == 2:
+        arr = arr[:, :, None]
+    if arr.shape[2] == 1:
+        return np.repeat(arr, 3, axis=2)
+    return arr
+
+
+def fit_image_array(arr, size, resample=None):
+    """RGB uint8 array at size (H, W); arrays already at that size skip the PIL resize.
+
+    resample is passed to PIL so each model keeps the filter of its upload path.
+    """
+    arr = to_rgb(arr)
+    if arr.shape[:2] != tuple(size):
+        img = Image.fromarray(arr)
+        target = (size[1], size[0])
+        arr = np.array(img.resize(target) if resample is None else img.resize(target, resample))
+    return arr
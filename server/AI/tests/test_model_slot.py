@@ -0,0 +1,161 @@
+# test_model_slot.py
+# ModelSlot hot-reload behaviour with a fake model; no TensorFlow needed.
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.model_slot import ModelSlot, SLOTS, reload_slots
+
+LOAD_SECONDS = 0.2
+WARMUP_SECONDS = 0.1
+REQUEST_SECONDS = 0.01
+
+
+class FakeModel:
+    def __init__(self, path):
+        self.path = path
+        self.released = False
+
+    def predict(self):
+        assert not self.released, "request ran on a released model"
+        time.sleep(REQUEST_SECONDS)
+        assert not self.released, "model released while a request was using it"
+        return self.path
+
+
+def load(path):
+    time.sleep(LOAD_SECONDS)
+    return FakeModel(path)
+
+
+def warm(model):
+    time.sleep(WARMUP_SECONDS)
+    model.predict()
+
+
+def mark_released(model):
+    model.released = True
+
+
+def wait_for_reload(*slots):
+    deadline = time.time() + 10
+    while any(s.status()["reloading"] for s in slots):
+        assert time.time() < deadline, "reload did not finish"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_slot():
+    names = []
+
+    def make(name, path="v0"):
+        names.append(name)
+        return ModelSlot(name, path, load, warm, on_release=mark_released)
+
+    yield make
+    for name in names:
+        SLOTS.pop(name, None)
+
+
+def test_swap_never_drops_or_stalls_requests(make_slot):
+    slot = make_slot("fake")
+    seen, latencies, errors = [], [], []
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with slot.acquire() as model:
+                    path = model.predict()
+                with lock:
+                    seen.append(path)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    try:
+        for i in range(1, 4):
+            assert slot.reload(f"v{i}")
+            wait_for_reload(slot)
+            time.sleep(0.03)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+    status = slot.status()
+    assert not errors
+    assert status["active"]["path"] == "v3"
+    assert not status["draining"]
+    assert {"v0", "v3"} <= set(seen)
+    # A stalled request would have waited for a load + warm-up
+    assert max(latencies) < (LOAD_SECONDS + WARMUP_SECONDS) / 2
+
+
+def test_old_version_released_only_when_idle(make_slot):
+    slot = make_slot("fake_idle")
+    with slot.borrow() as old:
+        assert slot.reload("v1", background=False)
+        assert slot.status()["active"]["path"] == "v1"
+        assert [v["version"] for v in slot.status()["draining"]] == [old.number]
+        assert not old.model.released
+        model = old.model
+    assert model.released
+    assert old.model is None
+    assert not slot.status()["draining"]
+
+
+def test_reload_refused_while_running(make_slot):
+    slot = make_slot("fake_busy")
+    assert slot.reload("v1")
+    assert not slot.reload("v2")
+    wait_for_reload(slot)
+    assert slot.status()["active"]["path"] == "v1"
+
+
+def test_linked_slots_swap_together(make_slot):
+    a = make_slot("fake_a")
+    b = make_slot("fake_b")
+    b_may_load = threading.Event()
+    b.loader = lambda path: b_may_load.wait(5) and FakeModel(path)
+
+    assert reload_slots(["fake_a", "fake_b"], {"fake_a": "v1", "fake_b": "v1"}) == {"fake_a": True, "fake_b": True}
+    # a's new version is ready long before b's; it must not go live on its own
+    time.sleep(LOAD_SECONDS + WARMUP_SECONDS + 0.1)
+    assert a.status()["active"]["path"] == "v0"
+
+    b_may_load.set()
+    wait_for_reload(a, b)
+    assert a.status()["active"]["path"] == b.status()["active"]["path"] == "v1"
+
+
+def test_failed_reload_keeps_active_version(make_slot):
+    slot = make_slot("fake_fail")
+    slot.loader = lambda path: (_ for _ in ()).throw(OSError("missing file"))
+    assert slot.reload("v1", background=False)
+    status = slot.status()
+    assert status["active"]["path"] == "v0"
+    assert "missing file" in status["last_error"]
+
+
+def test_reload_path_only_for_named_slots(make_slot):
+    full = make_slot("fake_full", "full_v0")
+    screen = make_slot("fake_screen", "screen_v0")
+    reload_slots(["fake_full", "fake_screen"], {"fake_full": "full_v1"})
+    wait_for_reload(full, screen)
+    assert full.status()["active"]["path"] == "full_v1"
+    # Reloaded from its own file, not the one meant for the other slot
+    assert screen.status()["active"]["path"] == "screen_v0"
+    assert screen.status()["active"]["version"] == 2
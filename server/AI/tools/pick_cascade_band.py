@@ -0,0 +1,125 @@
+# pick_cascade_band.py
+# Picks both edges of the lungs cascade band on a labeled set, then reports
+# how many images reach the full model and the throughput vs full-model-only.
+#   band_lo: images below it are reported NORMAL, so it is set from a sensitivity
+#            target on abnormal images.
+#   band_hi: images above it keep the screen's labels, so it is set from a
+#            specificity target on normal images.
+#
+# The labeled set is a CSV in the NIH ChestX-ray14 layout ("Image Index",
+# "Finding Labels" with "|"-separated labels or "No Finding").
+# Run from server/AI:
+#   python tools/pick_cascade_band.py --csv Data_Entry_2017.csv --images images/ \
+#       --target-sensitivity 0.95 --target-specificity 0.99
+import argparse
+import math
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.Lungs import LABELS, load_image, screen_lungs, predict_lungs_cascade
+
+
+def load_labeled_set(csv_path, images_dir, limit=None):
+    df = pd.read_csv(csv_path)
+    if limit:
+        df = df.sample(n=min(limit, len(df)), random_state=0)
+    images, abnormal = [], []
+    for _, row in df.iterrows():
+        path = os.path.join(images_dir, row["Image Index"])
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            images.append(f.read())
+        findings = set(str(row["Finding Labels"]).split("|"))
+        abnormal.append(bool(findings & set(LABELS)))
+    return images, np.array(abnormal)
+
+
+def screen_max_probs(images, batch_size):
+    out = []
+    for i in range(0, len(images), batch_size):
+        raw_imgs = [load_image(src)[1] for src in images[i:i + batch_size]]
+        preds = screen_lungs(raw_imgs)
+        if preds is None:
+            raise SystemExit("No screen model loaded; nothing to calibrate.")
+        out.append(preds.max(axis=1))
+    return np.concatenate(out)
+
+
+def pick_band_lo(max_probs, abnormal, target_sensitivity):
+    """Largest lower edge that still sends target_sensitivity of abnormal images past the screen."""
+    positives = np.sort(max_probs[abnormal])[::-1]
+    if len(positives) == 0:
+        raise SystemExit("The labeled set has no abnormal images.")
+    k = max(1, math.ceil(target_sensitivity * len(positives)))
+    return float(positives[k - 1])
+
+
+def pick_band_hi(max_probs, abnormal, target_specificity, lo):
+    """Smallest upper edge that keeps target_specificity of normal images at or below it."""
+    negatives = np.sort(max_probs[~abnormal])
+    if len(negatives) == 0:
+        raise SystemExit("The labeled set has no normal images.")
+    k = max(1, math.ceil(target_specificity * len(negatives)))
+    return max(float(negatives[k - 1]), lo)
+
+
+def run_cascade(images, band, batch_size, with_gradcam, use_screen=True):
+    totals = {"images": 0, "full_model": 0, "seconds": 0.0}
+    for i in range(0, len(images), batch_size):
+        _, stats = predict_lungs_cascade(images[i:i + batch_size], band=band,
+                                         with_gradcam=with_gradcam, use_screen=use_screen)
+        totals["images"] += stats["images"]
+        totals["full_model"] += stats["full_model"]
+        totals["seconds"] += stats["seconds"]
+    totals["images_per_sec"] = totals["images"] / totals["seconds"] if totals["seconds"] else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--target-sensitivity", type=float, default=0.95)
+    parser.add_argument("--target-specificity", type=float, default=0.99)
+    parser.add_argument("--band-hi", type=float, default=None,
+                        help="use this upper edge instead of picking one (1.0 escalates everything the screen does not clear)")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--gradcam", action="store_true", help="include Grad-CAM in the throughput runs")
+    args = parser.parse_args()
+
+    images, abnormal = load_labeled_set(args.csv, args.images, args.limit)
+    print(f"Loaded {len(images)} images ({int(abnormal.sum())} abnormal)")
+
+    max_probs = screen_max_probs(images, args.batch_size)
+    lo = pick_band_lo(max_probs, abnormal, args.target_sensitivity)
+    if args.band_hi is None:
+        hi = pick_band_hi(max_probs, abnormal, args.target_specificity, lo)
+    elif args.band_hi < lo:
+        raise SystemExit(f"--band-hi {args.band_hi} is below the picked band_lo {lo:.4f}")
+    else:
+        hi = args.band_hi
+    band = (lo, hi)
+
+    sensitivity = (max_probs >= lo)[abnormal].mean()
+    specificity = (max_probs <= hi)[~abnormal].mean() if (~abnormal).any() else float("nan")
+    escalated = ((max_probs >= lo) & (max_probs <= hi)).mean()
+    print(f"Band: [{band[0]:.4f}, {band[1]:.4f}]  below band_lo sensitivity: {sensitivity:.3f}  "
+          f"above band_hi specificity: {specificity:.3f}  sent to full model: {escalated:.1%}")
+
+    cascade = run_cascade(images, band, args.batch_size, args.gradcam)
+    full = run_cascade(images, band, args.batch_size, args.gradcam, use_screen=False)
+    print(f"{'mode':<10}{'full model':>12}{'images/s':>11}")
+    print(f"{'cascade':<10}{cascade['full_model']:>12}{cascade['images_per_sec']:>11.2f}")
+    print(f"{'full':<10}{full['full_model']:>12}{full['images_per_sec']:>11.2f}")
+    print(f"Speed-up: {cascade['images_per_sec'] / full['images_per_sec']:.2f}x")
+    print(f"Set CASCADE_BAND = ({band[0]:.4f}, {band[1]:.4f}) in controllers/Lungs.py to use this band.")
+
+
+if __name__ == "__main__":
+    main()